@@ -1,66 +1,196 @@
 import streamlit as st
 from langgraph.graph import StateGraph, END
+from langgraph.types import Send
 from typing import TypedDict, Annotated
 import operator
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
+from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, AIMessage, ToolMessage
 from langchain_openai import ChatOpenAI
 from langchain_community.tools.tavily_search import TavilySearchResults
 import os
-from PIL import Image
-from io import BytesIO
+import json
+import asyncio
+import queue
+import threading
+import httpx
+import importlib.util
+import tiktoken
+from collections import OrderedDict
+import numpy as np
+from sentence_transformers import SentenceTransformer
 
 # Load environment variables
 from dotenv import load_dotenv
 _ = load_dotenv()
 
-# Initialize search tool
-tool = TavilySearchResults(max_results=4)
+# Must be the first Streamlit call; cached resources below may render a spinner while they build
+st.set_page_config(page_title="AI Research Assistant", layout="wide")
 
 # Define AgentState
 class AgentState(TypedDict):
     messages: Annotated[list[AnyMessage], operator.add]
+    steps: Annotated[int, operator.add]
+
+# Input of one action node invocation: a single tool call fanned out from the llm node
+class ToolCallState(TypedDict):
+    tool_call: dict
+
+# Tool results longer than this are handed to the strong model for the final answer
+LARGE_TOOL_RESULT_CHARS = 2000
+
+def has_large_tool_result(messages):
+    for m in reversed(messages):
+        if not isinstance(m, ToolMessage):
+            return False
+        if len(str(m.content)) > LARGE_TOOL_RESULT_CHARS:
+            return True
+    return False
+
+# Tool results longer than this are summarized by the fast model before reaching the LLM
+MAX_TOOL_RESULT_CHARS = 6000
+
+# Keep only the fields the LLM needs from search results, as compact JSON instead of a dict repr
+def compact_tool_result(result):
+    if isinstance(result, list) and all(isinstance(r, dict) and "url" in r and "content" in r for r in result):
+        results = [{"title": r.get("title", ""), "snippet": r["content"][:400], "url": r["url"]} for r in result]
+        return json.dumps(results, ensure_ascii=False, separators=(",", ":"))
+    return str(result)
+
+# Token budget for the conversation sent to the LLM on each turn
+MAX_PROMPT_TOKENS = 8000
+encoding = tiktoken.encoding_for_model("gpt-4o")
+
+def count_tokens(message):
+    return len(encoding.encode(str(message.content))) + 4
+
+# Replace the oldest tool results with a stub until the conversation fits the budget.
+# Results the model has not answered yet are always kept, and tool call/result pairs stay intact.
+def prune_messages(messages, max_tokens=MAX_PROMPT_TOKENS):
+    total = sum(count_tokens(m) for m in messages)
+    if total <= max_tokens:
+        return messages
+    last_call = max((i for i, m in enumerate(messages) if isinstance(m, AIMessage) and m.tool_calls), default=0)
+    pruned = list(messages)
+    for i, m in enumerate(messages[:last_call]):
+        if total <= max_tokens:
+            break
+        if isinstance(m, ToolMessage):
+            stub = ToolMessage(tool_call_id=m.tool_call_id, name=m.name, content="[Earlier tool result omitted]")
+            total -= count_tokens(m) - count_tokens(stub)
+            pruned[i] = stub
+    return pruned
 
 # Define AI Agent
 class Agent:
-    def __init__(self, model, tools, system=""):
+    def __init__(self, model, tools, system="", fast_model=None, max_steps=6):
         self.system = system
+        self.max_steps = max_steps
+        self.system_messages = [SystemMessage(content=system)] if system else []
         graph = StateGraph(AgentState)
         graph.add_node("llm", self.call_openai)
         graph.add_node("action", self.take_action)
         graph.add_conditional_edges(
             "llm",
-            self.exists_action,
-            {True: "action", False: END}
+            self.route_tool_calls,
+            ["action", END]
         )
         graph.add_edge("action", "llm")
         graph.set_entry_point("llm")
         self.graph = graph.compile()
         self.tools = {t.name: t for t in tools}
         self.model = model.bind_tools(tools)
+        self.answer_model = model
+        self.fast_model = fast_model.bind_tools(tools) if fast_model is not None else None
+        self.summarizer = fast_model
 
-    def exists_action(self, state: AgentState):
-        result = state['messages'][-1]
-        return len(result.tool_calls) > 0
-
-    def call_openai(self, state: AgentState):
-        messages = state['messages']
-        if self.system:
-            messages = [SystemMessage(content=self.system)] + messages
-        message = self.model.invoke(messages)
-        return {'messages': [message]}
-
-    def take_action(self, state: AgentState):
-        tool_calls = state['messages'][-1].tool_calls
-        results = []
-        for t in tool_calls:
-            st.info(f"Calling tool: {t['name']} with arguments: {t['args']}")
-            if not t['name'] in self.tools:
-                result = "Invalid tool call, retrying..."
-            else:
-                result = self.tools[t['name']].invoke(t['args'])
-            results.append(ToolMessage(tool_call_id=t['id'], name=t['name'], content=str(result)))
-        st.info("Returning to LLM with tool results...")
-        return {'messages': results}
+    def route_tool_calls(self, state: AgentState):
+        last = state['messages'][-1]
+        if not last.tool_calls or state['steps'] >= self.max_steps:
+            return END
+        # One action invocation per tool call; LangGraph runs them concurrently in the same step
+        return [Send("action", {"tool_call": t}) for t in last.tool_calls]
+
+    def select_model(self, messages, steps):
+        # The last allowed step gets no tools, so the model has to answer with what it has
+        if steps + 1 >= self.max_steps:
+            return self.answer_model
+        # The fast model handles tool dispatch; the strong model synthesizes over large tool results
+        if self.fast_model is None or has_large_tool_result(messages):
+            return self.model
+        return self.fast_model
+
+    async def call_openai(self, state: AgentState):
+        model = self.select_model(state['messages'], state['steps'])
+        messages = self.system_messages + prune_messages(state['messages'])
+        # Tokens reach the UI through the graph's "messages" stream while the model generates
+        message = await model.ainvoke(messages)
+        return {'messages': [message], 'steps': 1}
+
+    async def summarize(self, content):
+        if self.summarizer is None or len(content) <= MAX_TOOL_RESULT_CHARS:
+            return content
+        message = await self.summarizer.ainvoke([
+            SystemMessage(content="Summarize this tool output concisely. Keep facts, figures and source URLs."),
+            HumanMessage(content=content)
+        ])
+        return message.content
+
+    async def take_action(self, state: ToolCallState):
+        t = state['tool_call']
+        if not t['name'] in self.tools:
+            content = "Invalid tool call, retrying..."
+        else:
+            try:
+                content = compact_tool_result(await self.tools[t['name']].ainvoke(t['args']))
+            except Exception as e:
+                content = f"Error: {e}"
+        content = await self.summarize(content)
+        return {'messages': [ToolMessage(tool_call_id=t['id'], name=t['name'], content=content)]}
+
+# Semantic response cache: exact-match lookup first, then nearest cached question by cosine similarity
+class SemanticCache:
+    def __init__(self, embedder, threshold=0.87, max_size=256):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_size = max_size
+        self.entries = OrderedDict()  # normalized question -> (embedding, answer), in LRU order
+        self.lock = threading.Lock()
+
+    def _normalize(self, query):
+        return " ".join(query.lower().split())
+
+    def _embed(self, key):
+        return self.embedder.encode(key, normalize_embeddings=True)
+
+    def lookup(self, query):
+        key = self._normalize(query)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key][1]
+            if not self.entries:
+                return None
+        embedding = self._embed(key)
+        with self.lock:
+            keys = list(self.entries)
+            similarities = np.stack([self.entries[k][0] for k in keys]) @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            self.entries.move_to_end(keys[best])
+            return self.entries[keys[best]][1]
+
+    def store(self, query, answer):
+        key = self._normalize(query)
+        embedding = self._embed(key)
+        with self.lock:
+            self.entries[key] = (embedding, answer)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+@st.cache_resource
+def get_response_cache():
+    return SemanticCache(SentenceTransformer("all-MiniLM-L6-v2"))
 
 # Define system prompt
 system_prompt = """You are an intelligent assistant that retrieves relevant information. \
@@ -69,12 +199,83 @@ You may issue multiple information requests when necessary. \
 Ensure responses are well-structured and accurate.
 """
 
-# Initialize agent
-model = ChatOpenAI(model="gpt-4o")
-abot = Agent(model, [tool], system=system_prompt)
+# Long-lived event loop for the agent; the shared HTTP client's pooled connections are bound to it
+@st.cache_resource
+def get_event_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+# Shared HTTP/2 client so repeated OpenAI calls reuse open TCP/TLS connections
+@st.cache_resource
+def get_http_client():
+    return httpx.AsyncClient(
+        # HTTP/2 needs the optional h2 package; without it the client falls back to HTTP/1.1 keep-alive
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    )
+
+# Initialize agent once: the search tool, model and compiled graph are reused across Streamlit reruns
+@st.cache_resource
+def get_agent():
+    tool = TavilySearchResults(max_results=4)
+    http_client = get_http_client()
+    fast_model = ChatOpenAI(model="gpt-4o-mini", temperature=0, streaming=True, http_async_client=http_client)
+    model = ChatOpenAI(model="gpt-4o", streaming=True, http_async_client=http_client)
+    return Agent(model, [tool], system=system_prompt, fast_model=fast_model)
+
+abot = get_agent()
+
+# Run the graph on the agent event loop and yield its stream events in the calling (script) thread
+def stream_agent(messages):
+    events = queue.Queue()
+
+    async def pump():
+        try:
+            async for event in abot.graph.astream({"messages": messages}, stream_mode=["messages", "updates"]):
+                events.put(event)
+        finally:
+            events.put(None)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), get_event_loop())
+    try:
+        while (event := events.get()) is not None:
+            yield event
+        future.result()
+    finally:
+        future.cancel()
+
+# Render tool activity and stream the answer tokens; returns the final answer
+def render_agent_run(messages):
+    answer, placeholder, pending_tools = "", None, 0
+    for mode, payload in stream_agent(messages):
+        if mode == "messages":
+            chunk, metadata = payload
+            if metadata.get("langgraph_node") == "llm" and chunk.content:
+                if placeholder is None:
+                    placeholder = st.empty()
+                answer += chunk.content
+                placeholder.markdown(answer)
+        elif "llm" in payload:
+            message = payload["llm"]["messages"][-1]
+            for t in message.tool_calls:
+                st.info(f"Calling tool: {t['name']} with arguments: {t['args']}")
+            pending_tools = len(message.tool_calls)
+            # Each LLM turn gets its own placeholder below the tool activity it follows
+            answer, placeholder = message.content, None
+        elif "action" in payload:
+            # Every tool call runs as its own action node; report once all of them have finished
+            pending_tools -= 1
+            if pending_tools == 0:
+                st.info("Returning to LLM with tool results...")
+    return answer
+
+# The graph structure is static, so render it with Graphviz only once
+@st.cache_resource
+def get_graph_image(_graph):
+    return _graph.get_graph().draw_png()
 
 # Streamlit UI
-st.set_page_config(page_title="AI Research Assistant", layout="wide")
 st.title("AI Research Assistant")
 
 # Sidebar layout with instructions and execution graph
@@ -87,24 +288,31 @@ with st.sidebar:
 
     # Display execution flow in the sidebar
     st.subheader("Execution Flow")
-    graph_image = abot.graph.get_graph().draw_png()
-    image = Image.open(BytesIO(graph_image))
-    st.image(image, caption="Graph Structure", use_container_width=True)
-
-# User input
-user_query = st.text_area("Enter your question:", "")
-
-# Button to submit query
-if st.button("Get Answer"):
-    if user_query.strip():
-        with st.spinner("Processing..."):
-            messages = [HumanMessage(content=user_query)]
-            result = abot.graph.invoke({"messages": messages})
-            st.success("Response received!")
-
-            # Display response
-            st.subheader("AI Response:")
-            st.write(result['messages'][-1].content)
-            st.success("Final answer displayed.")
-    else:
-        st.warning("Please enter a question before submitting.")
+    st.image(get_graph_image(abot.graph), caption="Graph Structure", use_container_width=True)
+
+# Only this fragment reruns when the question is edited or submitted, not the whole script
+@st.fragment
+def question_form():
+    # User input
+    user_query = st.text_area("Enter your question:", "")
+
+    # Button to submit query
+    if st.button("Get Answer"):
+        if user_query.strip():
+            response_cache = get_response_cache()
+            cached_answer = response_cache.lookup(user_query)
+            if cached_answer is not None:
+                st.subheader("AI Response:")
+                st.write(cached_answer)
+                st.success("Answer served from cache.")
+            else:
+                with st.spinner("Processing..."):
+                    messages = [HumanMessage(content=user_query)]
+                    st.subheader("AI Response:")
+                    answer = render_agent_run(messages)
+                    response_cache.store(user_query, answer)
+                    st.success("Final answer displayed.")
+        else:
+            st.warning("Please enter a question before submitting.")
+
+question_form()
@@ -1,61 +1,241 @@
 import streamlit as st
-from langchain.tools import Tool
-from langchain.agents import initialize_agent, AgentType
+from langchain.agents import AgentExecutor, create_openai_tools_agent
+from langchain_core.tools import tool
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.globals import set_llm_cache
+from langchain_community.cache import SQLiteCache
 from langchain_openai import ChatOpenAI
-from netmiko import ConnectHandler
+from netmiko import ConnectHandler, NetmikoTimeoutException
+from paramiko.ssh_exception import SSHException, AuthenticationException
+from tenacity import retry, stop_after_attempt, wait_exponential_jitter, retry_if_exception_type, retry_if_not_exception_type
+import httpx
+import importlib.util
+import os
 import re
+import time
+import threading
+from contextlib import contextmanager
+from typing import Union
 # Load environment variables
 from dotenv import load_dotenv
 _ = load_dotenv()
 
-# Function to execute Cisco command
-def execute_cisco_command(command: str):
+# SSH connection pool settings
+CONNECTION_POOL_ENABLED = os.getenv("CONNECTION_POOL_ENABLED", "true").lower() in ("1", "true", "yes")
+CONNECTION_POOL_MAX_SIZE = int(os.getenv("CONNECTION_POOL_MAX_SIZE", "8"))
+CONNECTION_POOL_IDLE_TIMEOUT = float(os.getenv("CONNECTION_POOL_IDLE_TIMEOUT", "300"))
+CONNECTION_POOL_MAX_AGE = float(os.getenv("CONNECTION_POOL_MAX_AGE", "3600"))
+
+# Fail fast on unreachable devices and retry transient SSH errors with jittered backoff.
+# Authentication failures are SSHExceptions too, but retrying them only risks locking out the account.
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=0.3, max=2),
+    retry=(
+        retry_if_exception_type((NetmikoTimeoutException, SSHException))
+        & retry_if_not_exception_type(AuthenticationException)
+    ),
+    reraise=True
+)
+def connect(device):
+    return ConnectHandler(**device, conn_timeout=5, banner_timeout=5, auth_timeout=5, fast_cli=True)
+
+class ConnectionEntry:
+    def __init__(self):
+        self.conn = None
+        self.created = self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+# Keeps one long-lived SSH session per (host, username) instead of reconnecting for every command
+class ConnectionPool:
+    def __init__(self, enabled, max_size, idle_timeout, max_age, reap_interval=30):
+        self.enabled = enabled
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.entries = {}
+        self.lock = threading.RLock()
+        if enabled:
+            threading.Thread(target=self._reap_forever, args=(reap_interval,), daemon=True).start()
+
+    def _expired(self, entry, now):
+        return now - entry.last_used > self.idle_timeout or now - entry.created > self.max_age
+
+    def _close(self, entry):
+        if entry.conn is not None:
+            try:
+                entry.conn.disconnect()
+            except Exception:
+                pass
+            entry.conn = None
+
+    def _make_room(self):
+        # Close least recently used idle sessions until there is room for a new one
+        with self.lock:
+            live = sorted((e for e in self.entries.values() if e.conn is not None), key=lambda e: e.last_used)
+        for entry in live[:max(0, len(live) - self.max_size + 1)]:
+            if entry.lock.acquire(blocking=False):
+                try:
+                    self._close(entry)
+                finally:
+                    entry.lock.release()
+
+    def _reap_forever(self, interval):
+        while True:
+            time.sleep(interval)
+            now = time.monotonic()
+            with self.lock:
+                entries = list(self.entries.values())
+            for entry in entries:
+                if entry.lock.acquire(blocking=False):
+                    try:
+                        if entry.conn is not None and self._expired(entry, now):
+                            self._close(entry)
+                    finally:
+                        entry.lock.release()
+
+    @contextmanager
+    def connection(self, device):
+        if not self.enabled:
+            conn = connect(device)
+            try:
+                yield conn
+            finally:
+                conn.disconnect()
+            return
+        key = (device["host"], device["username"])
+        with self.lock:
+            entry = self.entries.setdefault(key, ConnectionEntry())
+        with entry.lock:
+            now = time.monotonic()
+            if entry.conn is None or self._expired(entry, now) or not entry.conn.is_alive():
+                self._close(entry)
+                self._make_room()
+                entry.conn = connect(device)
+                entry.created = now
+            try:
+                yield entry.conn
+            except Exception:
+                # Drop the session, it may be left in an unknown state
+                self._close(entry)
+                raise
+            finally:
+                entry.last_used = time.monotonic()
+
+@st.cache_resource
+def get_connection_pool():
+    return ConnectionPool(
+        CONNECTION_POOL_ENABLED,
+        CONNECTION_POOL_MAX_SIZE,
+        CONNECTION_POOL_IDLE_TIMEOUT,
+        CONNECTION_POOL_MAX_AGE
+    )
+
+# Short-lived cache of show command output per (host, command)
+SHOW_OUTPUT_TTL = 30
+SHOW_COMMAND_RE = re.compile(r"^\s*sh(?:ow?)?\s", re.IGNORECASE)
+
+class OutputCache:
+    def __init__(self, ttl, max_size=256):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                return None
+            return entry[1]
+
+    def put(self, key, output):
+        with self.lock:
+            if len(self.entries) >= self.max_size:
+                now = time.monotonic()
+                self.entries = {k: e for k, e in self.entries.items() if now - e[0] <= self.ttl}
+                if len(self.entries) >= self.max_size:
+                    self.entries.pop(min(self.entries, key=lambda k: self.entries[k][0]))
+            self.entries[key] = (time.monotonic(), output)
+
+@st.cache_resource
+def get_output_cache():
+    return OutputCache(SHOW_OUTPUT_TTL)
+
+# Function to execute Cisco command, or a list of commands in one session
+@tool
+def execute_cisco_command(command: Union[str, list[str]]):
+    """Executes a Cisco show command on the device and returns its output.
+    Pass a list of commands to run them all in one session; the result then maps each command to its output."""
     device = {
         "device_type": "cisco_ios",
         "host": "198.18.128.3",  # Replace with actual device IP
         "username": "cisco",  # Replace with actual credentials
         "password": "cisco123",
     }
+    commands = [command] if isinstance(command, str) else command
+    cache = get_output_cache()
+    outputs = {c: cache.get((device["host"], c)) for c in commands}
     try:
-        connection = ConnectHandler(**device)
-        output = connection.send_command(command)
-        connection.disconnect()
-        return output
+        missing = [c for c in commands if outputs[c] is None]
+        if missing:
+            with get_connection_pool().connection(device) as connection:
+                # Detect the prompt once and reuse it for every command instead of re-probing it each time
+                prompt = re.escape(connection.find_prompt())
+                for c in missing:
+                    outputs[c] = connection.send_command(c, expect_string=prompt)
+                    if SHOW_COMMAND_RE.match(c):
+                        cache.put((device["host"], c), outputs[c])
     except Exception as e:
         return f"Error: {e}"
+    return outputs[command] if isinstance(command, str) else outputs
+
+# Matches every log line mentioning an error or a warning, compiled once
+LOG_RE = re.compile(r"^[^\r\n]*(?:error|warning)[^\r\n]*", re.IGNORECASE | re.MULTILINE)
+
+# Recognizes pasted device logs: Cisco %FACILITY-SEVERITY-MNEMONIC codes, syslog or ISO timestamps, interface state changes
+LOG_HEURISTIC_RE = re.compile(
+    r"%[A-Z0-9_]+-\d-[A-Z0-9_]+"
+    r"|\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}"
+    r"|\b[A-Z][a-z]{2} +\d{1,2} \d{2}:\d{2}:\d{2}"
+    r"|Interface \S+(?: is|, changed state to) (?:up|down)"
+)
+
+# Treat the query as pasted logs when at least three of its lines carry a log marker
+def looks_like_logs(text: str):
+    return sum(1 for line in text.splitlines() if LOG_HEURISTIC_RE.search(line)) >= 3
 
 # Function to analyze logs
+@tool
 def analyze_logs(log_data: str):
-    issues = []
-    if "error" in log_data.lower():
-        errors = re.findall(r"error.*", log_data, re.IGNORECASE)
-        issues.extend(errors)
-    if "warning" in log_data.lower():
-        warnings = re.findall(r"warning.*", log_data, re.IGNORECASE)
-        issues.extend(warnings)
+    """Analyzes logs and reports any errors or warnings found."""
+    issues = LOG_RE.findall(log_data)
     return "\n".join(issues) if issues else "No issues found in the logs."
 
-from langchain.prompts import PromptTemplate
-prompt_template = """
-You are a Smart Network Assistant designed to help network engineers troubleshoot and manage network devices efficiently. 
-Your primary tasks include checking device configurations, analyzing logs, and providing actionable insights for troubleshooting.
+# Callback that streams the agent's final answer into a Streamlit placeholder.
+# Tool-calling turns produce no content tokens, so only the answer turn is shown.
+class FinalAnswerStreamHandler(BaseCallbackHandler):
+    def __init__(self, placeholder):
+        self.placeholder = placeholder
+        self.buffer = ""
 
-You operate in a loop of Thought, Action, PAUSE, Observation, and Answer:
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.buffer = ""
 
-1. Thought: Describe your reasoning for the problem or query.
-2. Action: Choose one of the tools available to you, provide the required input, and return PAUSE.
-3. Observation: Wait for the result of the action to proceed.
-4. Answer: Provide the final output or solution based on your observations.
+    def on_llm_new_token(self, token: str, **kwargs):
+        if token:
+            self.buffer += token
+            self.placeholder.markdown(self.buffer)
 
-### Tools Available:
-- Execute Cisco Command:
-  - Example: Execute Cisco Command: show running-config
-  - Use this tool to retrieve configurations or status from a device.
+system_prompt = """
+You are a Smart Network Assistant designed to help network engineers troubleshoot and manage network devices efficiently. 
+Your primary tasks include checking device configurations, analyzing logs, and providing actionable insights for troubleshooting.
 
-- Analyze Logs:
-  - Example: Analyze Logs: [log content here]
-  - Use this tool to parse logs, identify errors, warnings, or patterns, and suggest resolutions.
+### Tools Available:
+- execute_cisco_command: retrieve configurations or status from a device. Pass a list of commands to run several in one session.
+- analyze_logs: parse logs and identify errors, warnings, or patterns.
 
 ### Guidelines:
 - Always prioritize clarity and precision in your responses.
@@ -63,66 +243,104 @@ You operate in a loop of Thought, Action, PAUSE, Observation, and Answer:
 - Assume you are working in a professional network environment and maintain a concise, professional tone.
 - If you notice that logs are provided as the query, analyse those logs try to identify what is the issue and provide some troubleshooting and remiediation steps
 
-Example Interaction:
+Stay within your role as a Smart Network Assistant, and always aim to assist the user with their tasks.
+""".strip()
 
-Query: Check the current interface statuses on the router.
-Thought: I should retrieve the interface statuses using the show ip interface brief command.
-Action: Execute Cisco Command: show ip interface brief
-PAUSE
+prompt = ChatPromptTemplate.from_messages([
+    ("system", system_prompt),
+    ("human", "{input}"),
+    MessagesPlaceholder("agent_scratchpad"),
+])
 
-Observation: 
-Interface              IP-Address      OK? Method Status                Protocol
-FastEthernet0/0        192.168.1.1     YES manual up                    up
-FastEthernet0/1        unassigned      YES unset  administratively down down
+# Exact-prompt LLM cache; the agent runs at temperature 0, so repeated prompts can reuse answers
+@st.cache_resource
+def init_llm_cache():
+    set_llm_cache(SQLiteCache(database_path=".lc_cache.db"))
 
-Answer: 
-Here are the current interface statuses:
-- FastEthernet0/0: IP 192.168.1.1 is UP and running.
-- FastEthernet0/1: No IP assigned and the interface is DOWN.
+init_llm_cache()
 
-Stay within your role as a Smart Network Assistant, and always aim to assist the user with their tasks.
-""".strip()
+# HTTP/2 client with a bounded keep-alive pool, reused for every OpenAI call
+@st.cache_resource
+def get_http_client():
+    return httpx.Client(
+        # HTTP/2 needs the optional h2 package; without it the client falls back to HTTP/1.1 keep-alive
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    )
 
-custom_prompt = PromptTemplate(template=prompt_template, input_variables=[])
+# Initialize agent once and reuse it across Streamlit reruns
+@st.cache_resource
+def get_agent():
+    llm = ChatOpenAI(temperature=0, model="gpt-4o", streaming=True, http_client=get_http_client())
+    tools = [execute_cisco_command, analyze_logs]
+    return AgentExecutor(
+        agent=create_openai_tools_agent(llm, tools, prompt),
+        tools=tools,
+        max_iterations=5,
+        max_execution_time=60,
+        # stream() bypasses the LLM cache; invoke() still streams tokens to callbacks because streaming=True
+        stream_runnable=False,
+        verbose=True
+    )
 
-cisco_tool = Tool(
-    name="Execute Cisco Command",
-    func=execute_cisco_command,
-    description="Executes a Cisco show command and retrieves its output."
-)
+agent = get_agent()
 
-log_tool = Tool(
-    name="Analyze Logs",
-    func=analyze_logs,
-    description="Analyzes logs and reports any errors or warnings found."
-)
+remediation_prompt = """
+You are a Smart Network Assistant. The user pasted device logs, possibly with a question, followed by the error and warning lines a log scan flagged.
+The scan only catches lines containing "error" or "warning", so base your analysis on the whole log.
+Identify the likely issue and give concise troubleshooting and remediation steps.
+""".strip()
 
-llm = ChatOpenAI(temperature=0, model="gpt-4")
-tools = [cisco_tool, log_tool]
+# Small model for log remediation advice; log triage does not need the agent's planning step
+@st.cache_resource
+def get_remediation_llm():
+    return ChatOpenAI(temperature=0, model="gpt-4o-mini", streaming=True, http_client=get_http_client())
 
-agent = initialize_agent(
-    tools,
-    llm,
-    agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-    verbose=True,
-    agent_kwargs={"custom_prompt": custom_prompt}
-)
+def remediate_logs(log_data: str, placeholder):
+    issues = analyze_logs.invoke(log_data)
+    st.info("Analyze Logs found:")
+    st.code(issues, language=None)
+    # The user's full input (logs and any question) goes once; the findings are extra context
+    content = f"{log_data}\n\nAnalyze Logs findings:\n{issues}"
+    # invoke() rather than stream() so repeated log pastes are served from the LLM cache
+    message = get_remediation_llm().invoke(
+        [
+            SystemMessage(content=remediation_prompt),
+            HumanMessage(content=content)
+        ],
+        config={"callbacks": [FinalAnswerStreamHandler(placeholder)]}
+    )
+    return message.content
 
 # Streamlit Interface
 st.title("AI Agent powered Network Assistant")
 st.write("Enter your query below and get real-time insights from your network device.")
 
-user_input = st.text_input("Enter your query or commands or logs to be analysed:")
+# Only this fragment reruns when a query is submitted, not the whole script
+@st.fragment
+def query_form():
+    # A text area keeps the line breaks of pasted logs, which text_input would flatten
+    user_input = st.text_area("Enter your query or commands or logs to be analysed:")
 
-if user_input:
-    with st.expander("Agent Logs", expanded=True):
-        with st.spinner("Processing..."):
-            try:
-                response = agent.run(user_input)
-                st.success("Response Generated!")
-                st.text_area("Agent Response:", response, height=200)
-            except Exception as e:
-                st.error(f"Error: {e}")
+    if user_input:
+        with st.expander("Agent Logs", expanded=True):
+            with st.spinner("Processing..."):
+                try:
+                    placeholder = st.empty()
+                    if looks_like_logs(user_input):
+                        response = remediate_logs(user_input, placeholder)
+                    else:
+                        result = agent.invoke(
+                            {"input": user_input},
+                            config={"callbacks": [FinalAnswerStreamHandler(placeholder)]}
+                        )
+                        response = result["output"]
+                    st.success("Response Generated!")
+                    placeholder.text_area("Agent Response:", response, height=200)
+                except Exception as e:
+                    st.error(f"Error: {e}")
+
+query_form()
 
 # Additional UI Enhancements
 st.sidebar.title("About This App")